@@ -18,10 +18,15 @@ setup(
     python_requires=">=3.7",
     install_requires=[
         "openai>=1.30.4,<2.0.0",
+        "httpx>=0.23.0,<1.0.0",
         "iso639-lang~=2.2.2",
         "click~=8.1.7",
         "ffmpeg-python~=0.2.0",
     ],
+    extras_require={
+        "uvloop": ["uvloop>=0.17.0; sys_platform != 'win32'"],
+        "mutagen": ["mutagen>=1.45.0"],
+    },
     entry_points={
         'console_scripts': [
             'transcribe = whisperstream.cmd:transcribe',
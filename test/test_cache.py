@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+from io import BytesIO
+from pathlib import Path
+from types import SimpleNamespace
+
+from whisperstream import RateLimiter, TranscriptionCache
+
+
+class FakeAPI:
+    def __init__(self):
+        self.requests = 0
+
+    async def __call__(self, model, file, duration_seconds, **kwargs):
+        self.requests += 1
+        return SimpleNamespace(text=f"{file.read().decode()} {model} {kwargs.get('prompt')}")
+
+
+def _file(data: bytes = b"audio") -> BytesIO:
+    f = BytesIO(data)
+    f.name = "audio.wav"
+    return f
+
+
+class TranscriptionCacheTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.cache_dir = Path(tmp_dir.name)
+        self.api = FakeAPI()
+
+    async def test_hit_skips_api_call(self):
+        cache = TranscriptionCache(self.api, cache_dir=self.cache_dir)
+        r1 = await cache("whisper-1", _file(), 1.0, prompt="a")
+        r2 = await TranscriptionCache(self.api, cache_dir=self.cache_dir)("whisper-1", _file(), 1.0, prompt="a")
+        self.assertEqual(self.api.requests, 1)
+        self.assertEqual(r1.text, "audio whisper-1 a")
+        self.assertEqual(r2.text, r1.text)
+
+    async def test_key(self):
+        cache = TranscriptionCache(self.api, cache_dir=self.cache_dir)
+        await cache("whisper-1", _file(), 1.0, prompt="a")
+
+        # options which do not change the response do not change the key
+        await cache(
+            "whisper-1", _file(), 1.0, prompt="a",
+            api_key="key", rate_limiter=RateLimiter(max_concurrency=1), max_retries=1, client=object(),
+        )
+        self.assertEqual(self.api.requests, 1)
+
+        await cache("whisper-1", _file(), 1.0, prompt="b")
+        self.assertEqual(self.api.requests, 2)
+        await cache("other-model", _file(), 1.0, prompt="a")
+        self.assertEqual(self.api.requests, 3)
+        await cache("whisper-1", _file(b"other audio"), 1.0, prompt="a")
+        self.assertEqual(self.api.requests, 4)
+
+    async def test_file_is_rewound(self):
+        cache = TranscriptionCache(self.api, cache_dir=self.cache_dir)
+        r = await cache("whisper-1", _file(), 1.0)
+        self.assertTrue(r.text.startswith("audio "))
+
+    async def test_max_entries(self):
+        cache = TranscriptionCache(self.api, cache_dir=self.cache_dir, max_entries=10)
+        await cache("whisper-1", _file(b"0"), 1.0)
+        first = next(self.cache_dir.glob("*.pickle"))
+        os.utime(first, ns=(0, 0))  # oldest entry
+
+        for i in range(1, 20):
+            await cache("whisper-1", _file(str(i).encode()), 1.0)
+            self.assertLessEqual(len(list(self.cache_dir.glob("*.pickle"))), 10)
+        self.assertFalse(first.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
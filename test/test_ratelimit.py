@@ -0,0 +1,74 @@
+import asyncio
+import unittest
+
+from whisperstream.ratelimit import RateLimiter
+
+
+class RateLimiterTest(unittest.IsolatedAsyncioTestCase):
+    async def test_cancel_during_rate_wait_releases_concurrency_slot(self):
+        limiter = RateLimiter(max_rate=1, time_period=10, max_concurrency=1)
+
+        async with limiter:  # uses up the only rate slot
+            pass
+
+        async def request():
+            async with limiter:
+                pass
+
+        task = asyncio.ensure_future(request())
+        await asyncio.sleep(0.05)  # task holds the semaphore and waits for a rate slot
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+        semaphore = limiter._get_semaphore()
+        self.assertFalse(semaphore.locked())
+        await asyncio.wait_for(semaphore.acquire(), timeout=1)
+        semaphore.release()
+
+    async def test_cancel_during_rate_wait_refunds_rate_slot(self):
+        limiter = RateLimiter(max_rate=1, time_period=10)
+
+        async with limiter:
+            pass
+        tat = limiter._tat
+
+        task = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+        self.assertAlmostEqual(limiter._tat, tat)
+
+    async def test_max_concurrency(self):
+        limiter = RateLimiter(max_concurrency=2)
+        in_flight = peak = 0
+
+        async def request():
+            nonlocal in_flight, peak
+            async with limiter:
+                in_flight += 1
+                peak = max(peak, in_flight)
+                await asyncio.sleep(0.01)
+                in_flight -= 1
+
+        await asyncio.gather(*(request() for _ in range(6)))
+        self.assertEqual(peak, 2)
+
+
+class RateLimiterLoopsTest(unittest.TestCase):
+    def test_used_from_several_event_loops(self):
+        limiter = RateLimiter(max_concurrency=1)
+
+        async def request():
+            async with limiter:
+                await asyncio.sleep(0)
+            self.assertFalse(limiter._get_semaphore().locked())
+
+        asyncio.run(request())
+        asyncio.run(request())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,222 @@
+import asyncio
+import unittest
+from typing import Dict, Optional
+from types import SimpleNamespace
+from io import BytesIO
+from unittest import mock
+
+import httpx
+import openai
+
+from whisperstream import atranscribe_streaming, atranscribe_streaming_simple, RateLimiter
+from whisperstream.error import AudioTrimError
+from whisperstream.stream import default_atranscribe_fn
+
+
+AUDIO_DURATION = 100.0
+
+
+def _chunk_size_fn(chunk_index: int) -> int:
+    return 20
+
+
+class FakeAPI:
+    """Fake `atranscribe_fn` returning one segment per 5 seconds of the chunk,
+    with texts naming the chunk they were cut from.
+    """
+
+    def __init__(self, delay: float = 0.0, delays: Optional[Dict[str, float]] = None):
+        self.delay = delay  # for all requests but the first one, unless set in `delays`
+        self.delays = delays or {}
+        self.requests = []
+        self.cancelled = []
+
+    async def __call__(self, model, file, duration_seconds, **kwargs):
+        chunk = file.read().decode()
+        self.requests.append((chunk, kwargs))
+        try:
+            await asyncio.sleep(self.delays.get(chunk, self.delay if len(self.requests) > 1 else 0))
+        except asyncio.CancelledError:
+            self.cancelled.append(chunk)
+            raise
+        if kwargs["response_format"] == "json":
+            return SimpleNamespace(text=f" {chunk}.")
+        n = max(1, int(duration_seconds // 5))
+        step = duration_seconds / n
+        segments = [
+            SimpleNamespace(seek=0.0, start=i * step, end=(i + 1) * step, text=f" {chunk}/{i}.", no_speech_prob=0.0)
+            for i in range(n)
+        ]
+        return SimpleNamespace(
+            text=f" {chunk}.",
+            segments=segments,
+            language="english",
+        )
+
+
+async def _fake_duration(path, executor=None):
+    return AUDIO_DURATION
+
+
+async def _fake_trim(path, start, end, **kwargs):
+    return f"{start:g}-{end:g}".encode()
+
+
+class StreamTestCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        for target, fake in [
+            ("whisperstream.stream.aget_audio_duration", _fake_duration),
+            ("whisperstream.stream.atrim_audio_and_convert", _fake_trim),
+        ]:
+            patcher = mock.patch(target, fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class TextOnlyTest(StreamTestCase):
+    async def test_atranscribe_streaming(self):
+        api = FakeAPI()
+        texts = []
+        async for r in atranscribe_streaming(
+            "audio.mp3", atranscribe_fn=api, chunk_size_fn=_chunk_size_fn, with_segments=False, start=10,
+        ):
+            self.assertIsNone(getattr(r, "segments", None))
+            texts.append(r.text.strip())
+        # chunks follow each other without overlap
+        self.assertEqual(texts, ["10-30.", "30-50.", "50-70.", "70-100."])
+        # only the first request detects the language
+        self.assertEqual([kw["response_format"] for _, kw in api.requests], ["verbose_json"] + ["json"] * 3)
+
+    async def test_atranscribe_streaming_simple(self):
+        api = FakeAPI()
+        with self.assertRaises(ValueError):
+            await atranscribe_streaming_simple("audio.mp3", atranscribe_fn=api, with_segments=False)
+        self.assertEqual(api.requests, [])
+
+
+class SerialTest(StreamTestCase):
+    async def test_segments_are_yielded_in_order(self):
+        api = FakeAPI(delay=0.01)
+        lang, segments = await atranscribe_streaming_simple(
+            "audio.mp3", atranscribe_fn=api, chunk_size_fn=_chunk_size_fn,
+        )
+        segments = [s async for s in segments]
+        self.assertEqual(lang.name, "English")
+        self.assertEqual(segments[0].start, 0)
+        self.assertEqual(segments[-1].end, AUDIO_DURATION)
+        for previous, segment in zip(segments, segments[1:]):
+            self.assertEqual(segment.start, previous.end)
+        # the incomplete last segment of a chunk is transcribed again as part of the next one
+        starts = [float(chunk.split("-")[0]) for chunk, _ in api.requests]
+        self.assertEqual(starts, [0, 15, 30, 45, 60, 75])
+        self.assertEqual(len(segments), 20)
+
+    async def test_prefetched_request_is_cancelled_on_aclose(self):
+        api = FakeAPI(delay=10.0)
+        gen = atranscribe_streaming("audio.mp3", atranscribe_fn=api, chunk_size_fn=_chunk_size_fn)
+        await gen.__anext__()
+        await asyncio.sleep(0.01)  # the next chunk is requested while the first one is consumed
+        self.assertEqual([chunk for chunk, _ in api.requests], ["0-20", "15-35"])
+        await gen.aclose()
+        self.assertEqual(api.cancelled, ["15-35"])
+
+    async def test_ignored_trim_error(self):
+        async def trim(path, start, end, **kwargs):
+            if end == AUDIO_DURATION:
+                raise AudioTrimError("nothing was encoded")
+            return await _fake_trim(path, start, end)
+
+        api = FakeAPI()
+        with mock.patch("whisperstream.stream.atrim_audio_and_convert", trim):
+            results = [
+                r async for r in atranscribe_streaming("audio.mp3", atranscribe_fn=api, chunk_size_fn=_chunk_size_fn)
+            ]
+            # the failed chunk is yielded empty, without a request
+            self.assertEqual(results[-1].segments, [])
+            self.assertEqual(results[-1].text, "")
+            self.assertEqual(len(api.requests), len(results) - 1)
+
+            with self.assertRaises(AudioTrimError):
+                async for _ in atranscribe_streaming(
+                    "audio.mp3", atranscribe_fn=FakeAPI(), chunk_size_fn=_chunk_size_fn,
+                    ignore_trim_errors_if_first_request_was_successful=False,
+                ):
+                    pass
+
+
+class ConcurrentTest(StreamTestCase):
+    async def test_results_are_yielded_in_order(self):
+        # later chunks finish first
+        api = FakeAPI(delays={"20-40": 0.06, "40-60": 0.04, "60-80": 0.02})
+        results = [
+            r async for r in atranscribe_streaming(
+                "audio.mp3", atranscribe_fn=api, chunk_size_fn=_chunk_size_fn, concurrency=3,
+            )
+        ]
+        self.assertEqual([r.text.strip() for r in results], ["0-20.", "20-40.", "40-60.", "60-80.", "80-100."])
+        self.assertEqual([r.segments[0].start for r in results], [0, 20, 40, 60, 80])
+
+    async def test_pending_requests_are_cancelled_on_aclose(self):
+        api = FakeAPI(delay=10.0, delays={"20-40": 0.0})
+        gen = atranscribe_streaming("audio.mp3", atranscribe_fn=api, chunk_size_fn=_chunk_size_fn, concurrency=3)
+        self.assertEqual((await gen.__anext__()).text, " 0-20.")
+        self.assertEqual((await gen.__anext__()).text, " 20-40.")
+        await asyncio.sleep(0.01)  # pending requests are in flight
+        await gen.aclose()
+        self.assertEqual(api.cancelled, ["40-60", "60-80"])
+
+
+class CountingRateLimiter(RateLimiter):
+    def __init__(self):
+        super().__init__()
+        self.acquired = 0
+
+    async def acquire(self):
+        self.acquired += 1
+        await super().acquire()
+
+
+class RetryTest(unittest.IsolatedAsyncioTestCase):
+    async def _transcribe(self, statuses, **kwargs):
+        responses = iter(statuses)
+        uploads = []
+
+        def handler(request):
+            uploads.append(request.read())
+            status = next(responses)
+            if status != 200:
+                return httpx.Response(status, json={"error": {"message": "error"}})
+            return httpx.Response(200, json={"text": "hi"})
+
+        client = openai.AsyncOpenAI(api_key="key", http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        limiter = CountingRateLimiter()
+        file = BytesIO(b"audio data")
+        file.name = "audio.wav"
+        with mock.patch("whisperstream.stream.RETRY_INITIAL_DELAY_SECONDS", 0.0):
+            try:
+                r = await default_atranscribe_fn(
+                    "whisper-1", file, 1.0, client=client, rate_limiter=limiter, response_format="json", **kwargs,
+                )
+            finally:
+                await client.close()
+        return r, uploads, limiter
+
+    async def test_retries_acquire_rate_limiter(self):
+        r, uploads, limiter = await self._transcribe([429, 500, 200])
+        self.assertEqual(r.text, "hi")
+        self.assertEqual(len(uploads), 3)
+        self.assertEqual(limiter.acquired, 3)
+        # the whole file is sent on every attempt
+        self.assertTrue(all(b"audio data" in upload for upload in uploads))
+
+    async def test_gives_up_after_max_retries(self):
+        with self.assertRaises(openai.RateLimitError):
+            await self._transcribe([429] * 3, max_retries=2)
+
+    async def test_client_errors_are_not_retried(self):
+        with self.assertRaises(openai.BadRequestError):
+            await self._transcribe([400, 200])
+
+
+if __name__ == "__main__":
+    unittest.main()
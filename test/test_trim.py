@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from whisperstream import trim
+
+
+class DurationCacheTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.paths = []
+        for i in range(3):
+            path = os.path.join(tmp_dir.name, f"{i}.mp3")
+            open(path, "wb").close()
+            self.paths.append(path)
+
+        self.probed = []
+
+        def probe(path):
+            self.probed.append(path)
+            return 10.0
+
+        for patcher in [
+            mock.patch.object(trim, "_DURATION_CACHE_SIZE", 2),
+            mock.patch.object(trim, "_duration_cache", trim.OrderedDict()),
+            mock.patch.object(trim, "get_audio_duration_mutagen", lambda path: None),
+            mock.patch.object(trim, "get_audio_duration_ffprobe", probe),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_least_recently_used_is_evicted(self):
+        a, b, c = self.paths
+        for path in [a, b, a, c, a, b]:
+            trim.get_audio_duration(path)
+        # `a` was used before `c` was added, so `b` was evicted instead
+        self.assertEqual(self.probed, [a, b, c, b])
+
+    def test_modified_file_is_probed_again(self):
+        a = self.paths[0]
+        trim.get_audio_duration(a)
+        with open(a, "wb") as f:
+            f.write(b"data")
+        trim.get_audio_duration(a)
+        self.assertEqual(self.probed, [a, a])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,6 @@
 from whisperstream.stream import (
     atranscribe_streaming,
     atranscribe_streaming_simple,
-)
\ No newline at end of file
+)
+from whisperstream.ratelimit import RateLimiter
+from whisperstream.cache import TranscriptionCache
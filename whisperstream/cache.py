@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import Callable, BinaryIO, Optional
+
+from openai.types.audio import Transcription
+
+from whisperstream.stream import default_atranscribe_fn
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.environ.get("WHISPERSTREAM_CACHE", "~/.cache/whisperstream")
+DEFAULT_MAX_ENTRIES = 10000
+
+# request options which do not affect the response
+_IGNORED_KWARGS = frozenset(("api_key", "rate_limiter", "max_retries", "client"))
+
+
+class TranscriptionCache:
+    """On-disk cache of transcription responses, so that when a failed
+    transcription is restarted, chunks which were already transcribed are
+    not sent to the OpenAI API again.
+
+    Wraps `atranscribe_fn`; responses are keyed by the chunk audio, the model
+    and the request options (language, prompt, response format, ...). Cache
+    files are read and written in `executor` (the default executor of the
+    event loop if None).
+
+    At most `max_entries` responses are kept: when there are more, the least
+    recently used ones (by file modification time, which is updated on every
+    hit) are removed. If None, the cache grows without bound and the caller
+    has to clean up `cache_dir`.
+
+    Responses are stored with pickle, so only use a cache directory that
+    cannot be written by untrusted users.
+
+    Usage:
+        >>> cache = TranscriptionCache()
+        >>> lang, segments = await atranscribe_streaming_simple(path, atranscribe_fn=cache)
+    """
+
+    def __init__(
+        self,
+        atranscribe_fn: Callable[..., Transcription] = default_atranscribe_fn,
+        cache_dir: Optional[os.PathLike] = None,
+        executor: Optional[Executor] = None,
+        max_entries: Optional[int] = DEFAULT_MAX_ENTRIES,
+    ):
+        if max_entries is not None and max_entries < 1:
+            raise ValueError(f"max_entries must be positive, got {max_entries}")
+        self.atranscribe_fn = atranscribe_fn
+        self.cache_dir = Path(cache_dir if cache_dir is not None else DEFAULT_CACHE_DIR).expanduser()
+        self.executor = executor
+        self.max_entries = max_entries
+        # number of cached responses, counted when the first one is stored
+        self._entries: Optional[int] = None
+        self._lock = threading.Lock()
+
+    async def __call__(
+        self,
+        model: str,
+        file: BinaryIO,
+        duration_seconds: float,
+        *args,
+        **kwargs,
+    ) -> Transcription:
+        path = self.cache_dir / f"{self._get_key(model, file, args, kwargs)}.pickle"
+        loop = asyncio.get_running_loop()
+        r = await loop.run_in_executor(self.executor, self._load, path)
+        if r is not None:
+            return r
+        r = await self.atranscribe_fn(model, file, duration_seconds, *args, **kwargs)
+        await loop.run_in_executor(self.executor, self._store, path, r)
+        return r
+
+    @staticmethod
+    def _load(path: Path) -> Optional[Transcription]:
+        try:
+            with open(path, "rb") as f:
+                r = pickle.load(f)
+            os.utime(path)  # mark as recently used
+            return r
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Could not read cached transcription {path}: {e}")
+            return None
+
+    def _store(self, path: Path, r: Transcription):
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            # write to a temporary file first, so that a partially written
+            # response is never read
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, "wb") as f:
+                pickle.dump(r, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Could not cache transcription to {path}: {e}")
+            return
+        if self.max_entries is None:
+            return
+        with self._lock:
+            if self._entries is not None and self._entries < self.max_entries:
+                self._entries += 1
+                return
+            self._prune()
+
+    def _prune(self):
+        entries = []
+        for path in self.cache_dir.glob("*.pickle"):
+            try:
+                entries.append((path.stat().st_mtime_ns, path))
+            except FileNotFoundError:
+                pass
+        if len(entries) > self.max_entries:
+            # remove a bit more than needed, so that the directory is not listed on every store
+            keep = self.max_entries * 9 // 10
+            entries.sort()
+            for _, path in entries[:len(entries) - keep]:
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+            entries = entries[len(entries) - keep:]
+        self._entries = len(entries)
+
+    @staticmethod
+    def _get_key(model: str, file: BinaryIO, args: tuple, kwargs: dict) -> str:
+        h = hashlib.blake2b(digest_size=16)
+        h.update(file.read())
+        file.seek(0)  # the file is read again when it is sent
+        options = sorted((k, v) for k, v in kwargs.items() if k not in _IGNORED_KWARGS)
+        h.update(repr((model, args, options)).encode())
+        return h.hexdigest()
@@ -1,23 +1,74 @@
 import click
 import asyncio
 import os
+import sys
+import time
 
 from whisperstream import atranscribe_streaming_simple
 
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
-async def _run(path: os.PathLike, language_code: str = None):
-    lang, segments =  await atranscribe_streaming_simple(path, language=language_code)
+
+# how often buffered output is written to stdout
+OUTPUT_FLUSH_INTERVAL_SECONDS = 0.25
+
+
+async def _run(
+    path: os.PathLike,
+    language_code: str = None,
+    unbuffered: bool = True,
+    concurrency: int = 1,
+):
+    lang, segments =  await atranscribe_streaming_simple(
+        path, language=language_code, concurrency=concurrency,
+    )
     if language_code is None:
         click.echo(f"Detected language: {lang.name}")
+    buf = []
+    last_flush = time.monotonic()
     async for segment in segments:
-        click.echo(segment.text, nl=False)
-    click.echo("")
+        buf.append(segment.text)
+        if unbuffered or time.monotonic() - last_flush >= OUTPUT_FLUSH_INTERVAL_SECONDS:
+            click.echo("".join(buf), nl=False)
+            buf.clear()
+            last_flush = time.monotonic()
+    click.echo("".join(buf))
 
 
 @click.command()
 @click.argument('path', type=str)
 @click.option('--language-code', '-l', type=str, default=None)
-def transcribe(path: os.PathLike, language_code: str = None):
+@click.option(
+    '--concurrency', '-c',
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of chunks transcribed concurrently. Values above 1 are faster "
+         "on long files but do not pass the previous chunk's text as a prompt.",
+)
+@click.option(
+    '--unbuffered/--buffered',
+    default=None,
+    help="Print every segment as soon as it is transcribed. "
+         "Defaults to unbuffered output when stdout is a terminal.",
+)
+def transcribe(
+    path: os.PathLike,
+    language_code: str = None,
+    concurrency: int = 1,
+    unbuffered: bool = None,
+):
     """Transcribe audio file and print transcribed text to console
     """
-    asyncio.run(_run(path, language_code=language_code))
+    if unbuffered is None:
+        unbuffered = sys.stdout.isatty()
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    asyncio.run(_run(
+        path,
+        language_code=language_code,
+        unbuffered=unbuffered,
+        concurrency=concurrency,
+    ))
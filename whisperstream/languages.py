@@ -1,6 +1,13 @@
+from functools import lru_cache
+
 from iso639 import Lang
 from whisperstream.error import UnsupportedLanguageError
 
+@lru_cache(maxsize=256)
+def _lang(code: str) -> Lang:
+    return Lang(code)
+
+
 # langs from https://help.openai.com/en/articles/7031512-whisper-api-faq
 _WHISPER_LANGUAGES = [
     ('af', 'Afrikaans'),
@@ -62,11 +69,16 @@ _WHISPER_LANGUAGES = [
     ('cy', 'Welsh')
 ]
 
-SUPPORTED_LANGUAGES = [Lang(lang) for lang, _ in _WHISPER_LANGUAGES]
-
+SUPPORTED_LANGUAGES = []
+_LANG_TO_NAME = {}
+_NAME_TO_LANG = {}
 
-_LANG_TO_NAME = {Lang(lang): name for lang, name in _WHISPER_LANGUAGES}
-_NAME_TO_LANG = {name: Lang(lang) for lang, name in _WHISPER_LANGUAGES}
+for _code, _name in _WHISPER_LANGUAGES:
+    _l = _lang(_code)
+    SUPPORTED_LANGUAGES.append(_l)
+    _LANG_TO_NAME[_l] = _name
+    _NAME_TO_LANG[_name.casefold()] = _l
+del _code, _name, _l
 
 
 def get_lang_name(lang: Lang) -> str:
@@ -77,13 +89,13 @@ def get_lang_from_name(name: str) -> Lang:
     if not name:
         raise UnsupportedLanguageError("Language name cannot be empty")
     name = name.strip()
+    # Whisper reports detected language by its name, so check the names first
+    lang = _NAME_TO_LANG.get(name.casefold())
+    if lang is not None:
+        return lang
     try:
-        return Lang(name)
+        return _lang(name)
     except Exception:
-        pass
-    try:
-        return _NAME_TO_LANG[name.capitalize()]
-    except KeyError:
         raise UnsupportedLanguageError(f"Language {name} is not supported.")
 
 PUNCTUATION_PROMPTS_BY_LANG = {
@@ -147,4 +159,8 @@ PUNCTUATION_PROMPTS_BY_LANG = {
 }
 
 def get_punctuation_prompt_for_lang(lang: Lang) -> str:
-    return PUNCTUATION_PROMPTS_BY_LANG[lang.pt1]
\ No newline at end of file
+    return PUNCTUATION_PROMPTS_BY_LANG[lang.pt1]
+
+
+def get_punctuation_prompt_by_code(code: str) -> str:
+    return PUNCTUATION_PROMPTS_BY_LANG[code]
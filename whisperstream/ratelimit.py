@@ -0,0 +1,91 @@
+import asyncio
+import time
+import weakref
+from typing import Optional
+
+
+class RateLimiter:
+    """Client-side limit on OpenAI API requests.
+
+    Leaky bucket: after an idle period up to `max_rate` requests are let through
+    at once, after that requests are spaced evenly at `max_rate` per
+    `time_period` seconds. Additionally, at most `max_concurrency` requests
+    are allowed to be in flight at the same time. Limits set to None are
+    not enforced.
+
+    Usage:
+        >>> limiter = RateLimiter(max_rate=50, time_period=60, max_concurrency=8)
+        >>> async with limiter:
+        >>>     await client.audio.transcriptions.create(...)
+    """
+
+    def __init__(
+        self,
+        max_rate: Optional[float] = None,
+        time_period: float = 60.0,
+        max_concurrency: Optional[int] = None,
+    ):
+        if max_rate is not None and max_rate <= 0:
+            raise ValueError(f"max_rate must be positive, got {max_rate}")
+        if time_period <= 0:
+            raise ValueError(f"time_period must be positive, got {time_period}")
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError(f"max_concurrency must be positive, got {max_concurrency}")
+        self.max_rate = max_rate
+        self.time_period = time_period
+        self.max_concurrency = max_concurrency
+        self._interval = time_period / max_rate if max_rate is not None else 0.0
+        # theoretical arrival time of the next request (GCRA)
+        self._tat = 0.0
+        # semaphores are bound to the event loop they are used in
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    async def acquire(self):
+        if self.max_concurrency is None:
+            if self.max_rate is not None:
+                await self._wait_for_rate()
+            return
+        semaphore = self._get_semaphore()
+        await semaphore.acquire()
+        if self.max_rate is not None:
+            try:
+                await self._wait_for_rate()
+            except BaseException:
+                # cancelled while waiting for a rate slot, give the concurrency slot back
+                semaphore.release()
+                raise
+
+    def release(self):
+        if self.max_concurrency is not None:
+            self._get_semaphore().release()
+
+    async def _wait_for_rate(self):
+        now = time.monotonic()
+        tat = max(self._tat, now)
+        delay = tat - now - (self.max_rate - 1) * self._interval
+        # book the slot before sleeping, so concurrent callers queue up
+        self._tat = tat + self._interval
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            except BaseException:
+                # the request is not made, refund the booked slot
+                self._tat -= self._interval
+                raise
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+        return False
@@ -1,35 +1,47 @@
-from typing import Tuple, AsyncIterator, Callable, BinaryIO, Optional
+from typing import Tuple, AsyncIterator, Callable, BinaryIO, Optional, Dict, Literal
 from pathlib import Path
 import os
 import logging
+import random
 
 from io import BytesIO
 from iso639 import Lang
 from functools import partial
+from operator import attrgetter
+from collections import deque
+from contextvars import ContextVar
 
 import asyncio
 from concurrent.futures import Executor
 
+import httpx
 import openai
-from openai import AsyncOpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from openai.types.audio import Transcription
 
 from whisperstream.languages import (
-    get_punctuation_prompt_for_lang,
+    get_punctuation_prompt_by_code,
     get_lang_from_name,
     SUPPORTED_LANGUAGES,
 )
 from whisperstream.error import UnsupportedLanguageError, AudioTrimError
-from whisperstream.trim import get_audio_duration, trim_audio_and_convert
+from whisperstream.ratelimit import RateLimiter
+from whisperstream.trim import aget_audio_duration, atrim_audio_and_convert
 
 
 logger = logging.getLogger(__name__)
 
+_get_text = attrgetter("text")
+
 
 # the whisper model inference uses 30 seconds of audio at a time
 # so using chunks of smaller size is useless because they will be padded
 OPENAI_WHISPER_MODEL_CHUNK_SIZE_SECONDS = 30
 
+# the model only looks at the last 224 tokens of the prompt, so there
+# is no point in keeping more of the previous transcription than that
+MAX_PROMPT_LENGTH = 1000
+
 
 
 def default_chunk_size_fn(index: int) -> int:
@@ -43,14 +55,75 @@ def default_chunk_size_fn(index: int) -> int:
     return OPENAI_WHISPER_MODEL_CHUNK_SIZE_SECONDS * factor
 
 
+_SENTENCE_PUNCTUATION = frozenset("!?.")
+
+
 def is_punctuation_present(text: str) -> bool:
-    if not any(i.isupper() for i in text):
+    # both checks iterate over the text in C, without a Python frame per character
+    if not any(map(str.isupper, text)):
         return False
-    if not any(i in "!?." for i in text):
+    if _SENTENCE_PUNCTUATION.isdisjoint(text):
         return False
     return True
 
 
+# optional client-side limits on requests made by `default_atranscribe_fn`:
+# requests per minute and number of requests in flight
+_DEFAULT_RATE_LIMITER = RateLimiter(
+    max_rate=float(os.environ["WHISPERSTREAM_RPM"]) if os.environ.get("WHISPERSTREAM_RPM") else None,
+    time_period=60,
+    max_concurrency=int(os.environ["WHISPERSTREAM_MAX_INFLIGHT"]) if os.environ.get("WHISPERSTREAM_MAX_INFLIGHT") else None,
+)
+
+
+# retries of rate limit, server and connection errors made by `default_atranscribe_fn`
+# (5 attempts in total), with exponential backoff and jitter; every attempt waits for
+# the rate limiter, so retries count against the limits too
+MAX_RETRIES = 4
+RETRY_INITIAL_DELAY_SECONDS = 1.0
+RETRY_MAX_DELAY_SECONDS = 30.0
+
+_RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+# keep idle connections to the OpenAI API open long enough to survive a slow
+# consumer between chunks (the default is 5 seconds), so that the next request
+# does not pay for a new TCP and TLS handshake
+KEEPALIVE_EXPIRY_SECONDS = 60.0
+
+
+class _Clients:
+    """OpenAI clients sharing one connection pool, created on first use."""
+
+    def __init__(self):
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._clients: Dict[Optional[str], AsyncOpenAI] = {}
+
+    def get(self, api_key: Optional[str]) -> AsyncOpenAI:
+        client = self._clients.get(api_key)
+        if client is None:
+            if self._http_client is None:
+                self._http_client = DefaultAsyncHttpxClient(limits=httpx.Limits(
+                    max_connections=1000,
+                    max_keepalive_connections=100,
+                    keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+                ))
+            client = self._clients[api_key] = AsyncOpenAI(
+                api_key=api_key,
+                http_client=self._http_client,
+                max_retries=0,  # retried by `default_atranscribe_fn`
+            )
+        return client
+
+    async def aclose(self):
+        if self._http_client is not None:
+            await self._http_client.aclose()
+
+
+# clients of the `atranscribe_streaming` call the current request belongs to,
+# so that connections to the OpenAI API are kept alive between its chunks
+_current_clients: ContextVar[Optional[_Clients]] = ContextVar("whisperstream_clients", default=None)
+
+
 async def default_atranscribe_fn(
     model: str,
     file: BinaryIO,
@@ -59,15 +132,55 @@ async def default_atranscribe_fn(
     **kwargs,
 ) -> Transcription:
     if "prompt" in kwargs:
-        kwargs["prompt"] = kwargs["prompt"][-1000:]  # limit prompt to last 1000 chars, which is > OpenAI limit
+        kwargs["prompt"] = kwargs["prompt"][-MAX_PROMPT_LENGTH:]  # safety net for prompts passed by the caller
     api_key = kwargs.pop("api_key", openai.api_key)
-    client = AsyncOpenAI(api_key=api_key)
-    return await client.audio.transcriptions.create(
-        model=model,
-        file=file,
-        *args,
-        **kwargs,
-    )
+    rate_limiter = kwargs.pop("rate_limiter", None) or _DEFAULT_RATE_LIMITER
+    max_retries = kwargs.pop("max_retries", MAX_RETRIES)
+    client = kwargs.pop("client", None)
+    own_clients = None
+    if client is None:
+        clients = _current_clients.get()
+        if clients is None:  # called outside of `atranscribe_streaming`
+            clients = own_clients = _Clients()
+        client = clients.get(api_key)
+    elif client.max_retries:
+        client = client.with_options(max_retries=0)
+    try:
+        for attempt in range(max_retries + 1):
+            file.seek(0)  # the file was read by the previous attempt
+            try:
+                async with rate_limiter:
+                    return await client.audio.transcriptions.create(
+                        model=model,
+                        file=file,
+                        *args,
+                        **kwargs,
+                    )
+            except _RETRYABLE_ERRORS as e:
+                if attempt == max_retries:
+                    raise
+                delay = _get_retry_delay(e, attempt)
+                logger.warning(
+                    f"Transcription request failed: {e!r}, "
+                    f"retrying in {delay:.1f} seconds ({attempt + 1}/{max_retries})"
+                )
+                await asyncio.sleep(delay)
+    finally:
+        if own_clients is not None:
+            await own_clients.aclose()
+
+
+def _get_retry_delay(e: Exception, attempt: int) -> float:
+    # exponential backoff with full jitter, but not sooner than the server asks to
+    delay = random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, RETRY_INITIAL_DELAY_SECONDS * 2 ** attempt))
+    response = getattr(e, "response", None)
+    if response is not None:
+        try:
+            retry_after = float(response.headers.get("retry-after", 0))
+        except ValueError:
+            retry_after = 0.0
+        delay = max(delay, min(retry_after, RETRY_MAX_DELAY_SECONDS))
+    return delay
 
 
 async def atranscribe_streaming_simple(
@@ -82,6 +195,9 @@ async def atranscribe_streaming_simple(
     ignore_segments_with_no_speech_probability: float = 1.0,
     start: float = 0.0,
     end: Optional[float] = None,
+    audio_format: Literal["wav", "mp3", "ogg"] = "wav",
+    concurrency: int = 1,
+    yield_chunks: bool = False,
     **kwargs,
 ) -> Tuple[Lang, AsyncIterator[Transcription]]:
     """High level wrapper for streaming tracription with simple interface.
@@ -100,7 +216,10 @@ async def atranscribe_streaming_simple(
             custom retry logic.
         language (Optional[Lang], optional): Language of the audio. If not
             specified, it will be detected automatically. Defaults to None.
-        executor: (Optional[Executor], optional): Executor used to run blocking code.
+        executor: (Optional[Executor], optional): Executor used to run blocking code:
+            reading audio duration with mutagen, if it is installed, and decoding the
+            file when the duration cannot be determined by ffprobe. If not specified,
+            the default executor of the event loop is used.
         force_punctuation: (bool, optional): Locates rare cases of missed punctuation
             and forces it if necessary
         ignore_trim_errors_if_first_request_was_successful (bool): If during streaming,
@@ -109,11 +228,26 @@ async def atranscribe_streaming_simple(
             (in case there is at least single successful chunk). Defaults to True.
         ignore_segments_with_no_speech_probability (float): If < 1.0, ignores segments
             with predicted `no_speech_probability` > than provided value. Defaults to 1.0.
+        audio_format (Literal["wav", "mp3", "ogg"]): Format of audio chunks sent to the API.
+            "wav" is uncompressed 16 kHz mono audio, which needs no encoding, "mp3" makes
+            uploads several times smaller, and MP3 files are cut without re-encoding,
+            "ogg" is 16 kHz mono Opus at 24 kbps, about 10x smaller than "wav" at the
+            cost of encoding every chunk. Defaults to "wav".
+        concurrency (int): Number of chunks transcribed concurrently after the first
+            one. Values > 1 are faster but lower the quality at chunk borders,
+            see `atranscribe_streaming`. Defaults to 1.
+        yield_chunks (bool): If True, the generator yields a list of segments per
+            transcribed chunk instead of single segments. Defaults to False.
         kwargs: Additional arguments for OpenAI API
 
     Returns:
         Lang, AsyncGenerator[OpenAIObject]: Detected language and generator
-            of segments
+            of segments (or of lists of segments if `yield_chunks` is True).
+            The next chunk is requested while the current one is consumed, so
+            an extra request may be made after the consumer stops. Breaking out
+            of `async for` does not close the generator: call
+            `await segments.aclose()` (or use `contextlib.aclosing`) to cancel
+            requests and ffmpeg processes started ahead right away.
 
     Usage:
         >>> lang, segments = await atranscribe_streaming_simple("path/to/audio.mp3")
@@ -121,6 +255,12 @@ async def atranscribe_streaming_simple(
         >>> async for segment in segments:
         >>>     print(segment.text)
     """
+    if not kwargs.get("with_segments", True):
+        raise ValueError(
+            "atranscribe_streaming_simple yields segments, so `with_segments` cannot be False. "
+            "Use atranscribe_streaming for text-only transcription"
+        )
+
     gen = atranscribe_streaming(
         path=path,
         model=model,
@@ -133,6 +273,8 @@ async def atranscribe_streaming_simple(
         ignore_segments_with_no_speech_probability=ignore_segments_with_no_speech_probability,
         start=start,
         end=end,
+        audio_format=audio_format,
+        concurrency=concurrency,
         **kwargs,
     )
     it = gen.__aiter__()
@@ -142,14 +284,28 @@ async def atranscribe_streaming_simple(
     if len(first_elem.segments) > 0:
         first_elem.segments[0].text = first_elem.segments[0].text.lstrip()
 
+    # close the underlying generator when the returned one is closed, so that
+    # pending requests and ffmpeg processes are cancelled right away
     async def _gen():
-        for segment in first_elem.segments:
-            yield segment
-        async for elem in it:
-            for segment in elem.segments:
+        try:
+            for segment in first_elem.segments:
                 yield segment
+            async for elem in it:
+                for segment in elem.segments:
+                    yield segment
+        finally:
+            await gen.aclose()
+
+    async def _gen_chunks():
+        try:
+            yield first_elem.segments
+            async for elem in it:
+                yield elem.segments
+        finally:
+            await gen.aclose()
 
-    return get_lang_from_name(first_elem.language), _gen()
+    segments = _gen_chunks() if yield_chunks else _gen()
+    return get_lang_from_name(first_elem.language), segments
 
 
 async def atranscribe_streaming(
@@ -164,6 +320,9 @@ async def atranscribe_streaming(
     ignore_segments_with_no_speech_probability: float = 1.0,
     start: float = 0.0,
     end: Optional[float] = None,
+    audio_format: Literal["wav", "mp3", "ogg"] = "wav",
+    concurrency: int = 1,
+    with_segments: bool = True,
     **kwargs,
 ) -> AsyncIterator[Transcription]:
     """Low level OpenAI Whisper API wrapper for streaming transcription.
@@ -182,7 +341,10 @@ async def atranscribe_streaming(
             custom retry logic.
         language (Optional[Lang], optional): Language of the audio. If not
             specified, it will be detected automatically. Defaults to None.
-        executor: (Optional[Executor], optional): Executor used to run blocking code.
+        executor: (Optional[Executor], optional): Executor used to run blocking code:
+            reading audio duration with mutagen, if it is installed, and decoding the
+            file when the duration cannot be determined by ffprobe. If not specified,
+            the default executor of the event loop is used.
         force_punctuation: (bool, optional): Locates rare cases of missed punctuation
             and forces it if necessary.
         ignore_trim_errors_if_first_request_was_successful (bool): If during streaming,
@@ -191,15 +353,46 @@ async def atranscribe_streaming(
             (in case there is at least single successful chunk). Defaults to True.
         ignore_segments_with_no_speech_probability (float): If < 1.0, ignores segments
             with predicted `no_speech_probability` > than provided value. Defaults to 1.0.
+        audio_format (Literal["wav", "mp3", "ogg"]): Format of audio chunks sent to the API.
+            "wav" is uncompressed 16 kHz mono audio, which needs no encoding, "mp3" makes
+            uploads several times smaller, and MP3 files are cut without re-encoding,
+            "ogg" is 16 kHz mono Opus at 24 kbps, about 10x smaller than "wav" at the
+            cost of encoding every chunk. Defaults to "wav".
+        concurrency (int): Number of chunks transcribed concurrently after the first
+            one. If > 1, transcription is faster but of lower quality at chunk borders:
+            chunks are cut at fixed boundaries, so a word spanning a boundary may be
+            split in half or garbled, the incomplete last segment of a chunk is not
+            discarded and re-transcribed, and the text of the previous chunk is not
+            used as a prompt for the next one. Defaults to 1.
+        with_segments (bool): If False, only the text of each chunk is requested
+            (`json` instead of `verbose_json` response format), which makes responses
+            several times smaller. Chunks then follow each other without overlap,
+            and yielded responses have no `segments`. Defaults to True.
         kwargs: Additional arguments for OpenAI API
 
     Returns:
         AsyncGenerator[OpenAIObject]: Generator of OpenAI responses for consecutive
-            chunks of audio
+            chunks of audio. The request for the next chunk is sent while the current
+            response is being consumed, so one extra (billed) request may be made after
+            the consumer stops (up to `concurrency` with concurrent requests). Requests
+            started ahead are cancelled when the generator is closed with `aclose()`,
+            not when the caller breaks out of `async for`.
     """
 
-    # force "verbose_json" response format to get segments
-    kwargs["response_format"] = "verbose_json"
+    if concurrency < 1:
+        raise ValueError(f"Concurrency must be positive, got {concurrency}")
+
+    if not with_segments and ignore_segments_with_no_speech_probability < 1.0:
+        raise ValueError(
+            "Cannot filter segments by no speech probability when segments are not requested. "
+            "Please set `with_segments` to True"
+        )
+
+    # force "verbose_json" response format to get segments (and detected language)
+    if with_segments or language is None:
+        kwargs["response_format"] = "verbose_json"
+    else:
+        kwargs["response_format"] = "json"
 
     if language is not None:
         if language not in SUPPORTED_LANGUAGES:
@@ -215,180 +408,248 @@ async def atranscribe_streaming(
 
     path = Path(path).resolve()
 
-    def _f():
-        return get_audio_duration(path)
-    if executor is not None:
-        loop = asyncio.get_running_loop()
-        audio_duration = await loop.run_in_executor(executor, _f)
-    else:
-        audio_duration = _f()
+    # OpenAI clients shared by the requests of this call, so that connections
+    # are kept alive between chunks; closed together with the generator
+    clients = _Clients()
+    try:
+        audio_duration = await aget_audio_duration(path, executor=executor)
 
-    audio_duration = min(audio_duration, end) if end is not None else audio_duration
+        audio_duration = min(audio_duration, end) if end is not None else audio_duration
 
-    __transcribe = partial(
-        _transcribe,
-        path=path,
-        executor=executor,
-        atranscribe_fn=atranscribe_fn,
-        model=model,
-        **kwargs,
-    )
+        __trim = partial(_trim, path=path, audio_format=audio_format)
+        __send = partial(
+            _send, atranscribe_fn=atranscribe_fn, model=model, audio_format=audio_format, clients=clients,
+        )
 
-    logger.debug(f"Audio duration: {audio_duration}")
+        logger.debug(f"Audio duration: {audio_duration}")
+
+        def _get_end(start: int, chunk_index: int) -> int:
+            chunk_size = chunk_size_fn(chunk_index)
+            end = start + chunk_size
+            if (audio_duration - end) < chunk_size:  # do not make the last chunk too small
+                end = audio_duration
+            return end
+
+        def _process_segments(r: Transcription, start: float, end: float):
+            if not with_segments:
+                # the first chunk is requested as "verbose_json" when the language
+                # has to be detected, drop its segments to match the other chunks
+                if getattr(r, "segments", None):
+                    del r.segments
+                logger.debug(f"Text returned for start = {start} end = {end}: {r.text}")
+                return
+
+            # update seek and start/end times in all segments
+            if start:
+                for segment in r.segments:
+                    segment.seek += start
+                    segment.start += start
+                    segment.end += start
+
+            # skip formatting three debug lines per segment unless they are going to be logged
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"{len(r.segments)} segments returned for start = {start} end = {end}:")
+                for segment in r.segments:
+                    logger.debug(f"\ttext: {segment.text}")
+                    logger.debug(f"\tstart: {segment.start}")
+                    logger.debug(f"\tend: {segment.end}")
+
+            # filtering
+            if ignore_segments_with_no_speech_probability < 1.0:
+                r.segments = [
+                    x for x in r.segments
+                    if getattr(x, "no_speech_prob", 0.0) <= ignore_segments_with_no_speech_probability
+                ]
+
+        async def _trim_ignoring_errors(start: float, end: float) -> Optional[bytes]:
+            try:
+                return await __trim(start=start, end=end)
+            except AudioTrimError as e:
+                if ignore_trim_errors_if_first_request_was_successful:
+                    logger.warning(f"Ignoring AudioTrimError because the first request was successful, error: {str(e)}")
+                    return None
+                raise
 
-    def _get_end(start: int, chunk_index: int) -> int:
-        chunk_size = chunk_size_fn(chunk_index)
-        end = start + chunk_size
-        if (audio_duration - end) < chunk_size:  # do not make the last chunk too small
-            end = audio_duration
-        return end
+        async def _transcribe_ignoring_errors(start: float, end: float) -> Transcription:
+            data = await _trim_ignoring_errors(start, end)
+            if data is None:
+                return _FakeTranscription()
+            return await __send(data, start=start, end=end, **kwargs)
 
-    chunk_index = 0
-    end = _get_end(start, chunk_index)
+        chunk_index = 0
+        end = _get_end(start, chunk_index)
 
-    if force_punctuation and language is not None:
-        kwargs["prompt"] = get_punctuation_prompt_for_lang(language)
+        if force_punctuation and language is not None:
+            kwargs["prompt"] = get_punctuation_prompt_by_code(kwargs["language"])
 
-    r = await __transcribe(start=start, end=end, **kwargs)
+        data = await __trim(start=start, end=end)
+        r = await __send(data, start=start, end=end, **kwargs)
 
-    if language is None:
-        language = get_lang_from_name(r.language)
-        kwargs['language'] = language.pt1
+        if language is None:
+            language = get_lang_from_name(r.language)
+            kwargs['language'] = language.pt1
+            if not with_segments:
+                # language is known now, the rest of the chunks need only text
+                kwargs["response_format"] = "json"
 
-    if force_punctuation:
-        if not is_punctuation_present(r.text):
-            logger.info(
-                "Punctuation is not present, adding "
-                "prefix to force punctuation and restarting transcription"
-            )
-            kwargs["prompt"] = get_punctuation_prompt_for_lang(language) + " "
-            r = await __transcribe(start=start, end=end, **kwargs)
-        else:  # at least capitalize the first letter
-            r.text = capitalize(r.text)
-            if len(r.segments) > 0:
-                r.segments[0].text = capitalize(r.segments[0].text)
-
-    prompt_parts = []
-    if (_prompt := kwargs.get("prompt", "").strip()):
-        prompt_parts.append(_prompt)
-
-    while True:
-        # update seek and start/end times in all segments
-        for segment in r.segments:
-            segment.seek += start
-            segment.start += start
-            segment.end += start
-
-        logger.debug(f"{len(r.segments)} segments returned for start = {start} end = {end}:")
-        for segment in r.segments:
-            logger.debug(f"\ttext: {segment.text}")
-            logger.debug(f"\tstart: {segment.start}")
-            logger.debug(f"\tend: {segment.end}")
-
-        # filtering
-        if ignore_segments_with_no_speech_probability < 1.0:
-            r.segments = [
-                x for x in r.segments
-                if getattr(x, "no_speech_prob", 0.0) <= ignore_segments_with_no_speech_probability
-            ]
-
-        # if we are at the end of the audio, return all segments
-        # returned by OpenAI
-        if end >= audio_duration:
+        if force_punctuation:
+            if not is_punctuation_present(r.text):
+                logger.info(
+                    "Punctuation is not present, adding "
+                    "prefix to force punctuation and restarting transcription"
+                )
+                kwargs["prompt"] = get_punctuation_prompt_by_code(kwargs["language"]) + " "
+                r = await __send(data, start=start, end=end, **kwargs)
+            else:  # at least capitalize the first letter
+                r.text = capitalize(r.text)
+                if with_segments and len(r.segments) > 0:
+                    r.segments[0].text = capitalize(r.segments[0].text)
+
+        # the forced punctuation prompt is kept in front of the rolling context
+        # of previous chunks, so that trimming the context never drops it
+        if force_punctuation:
+            prompt_prefix, prompt = kwargs.get("prompt", "").strip(), ""
+        else:
+            prompt_prefix, prompt = "", kwargs.get("prompt", "").strip()
+        max_context_length = MAX_PROMPT_LENGTH - len(prompt_prefix) - 1
+
+        if concurrency > 1:
+            _process_segments(r, start, end)
             yield r
-            logger.debug(f"End of audio, yield text: {r.text}")
+
+            # chunks do not depend on each other, so keep up to `concurrency`
+            # requests in flight and yield responses in order
+            pending = deque()
+            try:
+                while pending or end < audio_duration:
+                    while len(pending) < concurrency and end < audio_duration:
+                        chunk_index += 1
+                        start, end = end, _get_end(end, chunk_index)
+                        task = asyncio.ensure_future(_transcribe_ignoring_errors(start, end))
+                        pending.append((start, end, task))
+                    chunk_start, chunk_end, task = pending.popleft()
+                    r = await task
+                    _process_segments(r, chunk_start, chunk_end)
+                    yield r
+            finally:
+                for _, _, task in pending:
+                    task.cancel()
+                await asyncio.gather(*(task for _, _, task in pending), return_exceptions=True)
             return
 
-        # if only one segment was returned, we have to continue
-        # transcription from the end of the segment
-        if len(r.segments) == 0:
-            start = end
-        elif len(r.segments) == 1:
-            start = end
-        else:
-            # if more than one segment was returned, we discard the last incomplete one
-            # and continue transcription from the end of the second to last
-            max_segments_to_skip = max(
-                1, len(r.segments) - 1
-            )
-            for _i in range(max_segments_to_skip):
-                logger.debug(f"Skipping segment -{_i}")
-                r.segments = r.segments[:-1]
-                if (r.segments[-1].end < end):
-                    break
-                else:
-                    logger.debug(f"Strange segment end {r.segments[-1].end}, skipping it. All segments:")
-            else:
-                logger.warning(
-                    f"Segment end {r.segments[-1].end} is greater than chunk end {end} even after "
-                    f"discarding {max_segments_to_skip} segments"
-                )
-            start = min(r.segments[-1].end, end)
-            r.text = ''.join(x.text for x in r.segments)
-
-        # update prompt with the text returned by OpenAI for the previous chunk
-        # to produce coherent transcription
-        new_prompt = r.text
-        if force_punctuation and not is_punctuation_present(new_prompt[-100:]):
-            new_prompt = update_prompt_with_punctuation(new_prompt)
-        new_prompt = new_prompt.replace("...", ".")  # avoid teaching the model to use "..."
-        prompt_parts.append(new_prompt)
-        kwargs["prompt"] = " ".join(x.strip() for x in prompt_parts)
-
-        yield r
-        logger.debug(f"Yield text: {r.text}")
-
-        chunk_index += 1
-        end = _get_end(start, chunk_index)
-        try:
-            r = await __transcribe(start=start, end=end, **kwargs)
-        except AudioTrimError as e:
-            if ignore_trim_errors_if_first_request_was_successful:
-                logger.warning(f"Ignoring AudioTrimError because the first request was successful, error: {str(e)}")
-                class FakeTranscription():
-                    def __init__(self):
-                        self.segments = []
-                        self.text = ""
-                r = FakeTranscription()
+        while True:
+            _process_segments(r, start, end)
+
+            # if we are at the end of the audio, return all segments
+            # returned by OpenAI
+            if end >= audio_duration:
+                yield r
+                logger.debug(f"End of audio, yield text: {r.text}")
+                return
+
+            # if only one segment was returned, we have to continue
+            # transcription from the end of the segment
+            if not with_segments or len(r.segments) == 0:
+                start = end
+            elif len(r.segments) == 1:
+                start = end
             else:
+                # if more than one segment was returned, we discard the last incomplete one
+                # and continue transcription from the end of the second to last
+                # (or earlier, if segments strangely end after the chunk end)
+                cut = len(r.segments) - 1
+                while cut > 1 and r.segments[cut - 1].end >= end:
+                    logger.debug(f"Strange segment end {r.segments[cut - 1].end}, skipping it")
+                    cut -= 1
+                if r.segments[cut - 1].end >= end:
+                    logger.warning(
+                        f"Segment end {r.segments[cut - 1].end} is greater than chunk end {end} even after "
+                        f"discarding {len(r.segments) - cut} segments"
+                    )
+                logger.debug(f"Skipping last {len(r.segments) - cut} segments")
+                del r.segments[cut:]
+                start = min(r.segments[-1].end, end)
+                r.text = ''.join(map(_get_text, r.segments))
+
+            # update prompt with the text returned by OpenAI for the previous chunk
+            # to produce coherent transcription
+            new_prompt = r.text
+            if force_punctuation and not is_punctuation_present(new_prompt[-100:]):
+                new_prompt = update_prompt_with_punctuation(new_prompt)
+            new_prompt = new_prompt.replace("...", ".")  # avoid teaching the model to use "..."
+            prompt = f"{prompt} {new_prompt.strip()}".lstrip()[-max_context_length:]
+            kwargs["prompt"] = f"{prompt_prefix} {prompt}".lstrip()
+
+            chunk_index += 1
+            end = _get_end(start, chunk_index)
+
+            # start transcribing the next chunk while the current one is being consumed,
+            # everything it depends on (start, end and prompt) is already known
+            next_task = asyncio.ensure_future(_transcribe_ignoring_errors(start, end))
+
+            try:
+                yield r
+            except BaseException:
+                next_task.cancel()
+                await asyncio.gather(next_task, return_exceptions=True)
                 raise
+            logger.debug(f"Yield text: {r.text}")
+
+            r = await next_task
+    finally:
+        await clients.aclose()
+
 
+class _FakeTranscription():
+    def __init__(self):
+        self.segments = []
+        self.text = ""
 
-async def _transcribe(
+
+async def _trim(
     *,
-    path: os.PathLike,
-    start: int,
-    end: int,
-    executor: Optional[Executor],
+    path: Path,
+    start: float,
+    end: float,
+    audio_format: Literal["wav", "mp3", "ogg"],
+) -> bytes:
+    logger.debug(f"Crop audio with start = {start} end = {end}")
+    # mp3 sources can be cut without re-encoding
+    stream_copy = audio_format == "mp3" and path.suffix.lower() == ".mp3"
+    return await atrim_audio_and_convert(
+        path, start, end, audio_format=audio_format, stream_copy=stream_copy,
+    )
+
+
+async def _send(
+    data: bytes,
+    *,
+    start: float,
+    end: float,
     atranscribe_fn: Callable[..., Transcription],
     model: str,
+    audio_format: Literal["wav", "mp3", "ogg"],
+    clients: _Clients,
     **kwargs,
 ) -> Transcription:
-    logger.debug("Crop audio")
-
-    def _f():
-        return trim_audio_and_convert(path, start, end)
-
-    if executor is not None:
-        loop = asyncio.get_running_loop()
-        data = await loop.run_in_executor(executor, _f)
-    else:
-        data = _f()
-
     # for debugging
-    # with open(f"debug_{start:.3f}_{end:.3f}.wav", "wb") as f:
+    # with open(f"debug_{start:.3f}_{end:.3f}.{audio_format}", "wb") as f:
     #     f.write(data)
 
     f = BytesIO(data)
-    f.name = "audio.wav"
+    f.name = f"audio.{audio_format}"
 
     logger.debug(f"Transcribe request with start = {start} end = {end}")
-    r = await atranscribe_fn(
-        model=model,
-        file=f,
-        duration_seconds=(end - start),
-        **kwargs,
-    )
+    token = _current_clients.set(clients)
+    try:
+        r = await atranscribe_fn(
+            model=model,
+            file=f,
+            duration_seconds=(end - start),
+            **kwargs,
+        )
+    finally:
+        _current_clients.reset(token)
     logger.debug("Transcribe request finished")
     return r
 
@@ -407,4 +668,8 @@ def update_prompt_with_punctuation(prompt: str) -> str:
 
 def capitalize(text):
     text = text.lstrip()
-    return text[:1].upper() + text[1:]
+    first = text[:1]
+    upper = first.upper()
+    if upper == first:  # already capitalized, avoid copying the text
+        return text
+    return upper + text[1:]
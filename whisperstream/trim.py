@@ -1,11 +1,23 @@
-from typing import Optional, Literal
+from typing import Optional, Literal, List, Tuple
 
+import asyncio
+import json
 import logging
+import os
+import threading
+from collections import OrderedDict
 from os import PathLike
+from concurrent.futures import Executor
 import re
 
 import ffmpeg
 
+try:
+    import mutagen
+    import mutagen.mp3
+except ImportError:
+    mutagen = None
+
 from .error import NoAudioStreamsError, AudioTrimError
 
 
@@ -16,8 +28,9 @@ def trim_audio_and_convert(
     input_file: PathLike,
     start: float = 0.0,
     end: Optional[float] = None,
-    audio_format: Literal["wav", "mp3"] = "wav",
+    audio_format: Literal["wav", "mp3", "ogg"] = "wav",
     output_file: Optional[PathLike] = None,
+    stream_copy: bool = False,
 ) -> bytes:
     """
     Convert a segment of an audio or video file to MP3 format and return as bytes.
@@ -28,37 +41,14 @@ def trim_audio_and_convert(
         output_file (str): Path to the output file, if None, will return bytes.
         start (float): Start time of the segment in seconds.
         end (float): End time of the segment in seconds.
-        audio_format (Literal["wav", "mp3"]): Audio format to convert to.
+        audio_format (Literal["wav", "mp3", "ogg"]): Audio format to convert to.
+        stream_copy (bool): Try to cut the audio stream without re-encoding first,
+            only possible if the input is already in `audio_format`.
 
     Returns:
         bytes: MP3 data of the specified segment.
     """
-    assert start >= 0, f"Start time must be non-negative, got {start}"
-    kwargs = {}
-    if end is not None:
-        duration = end - start
-        assert duration > 0, f"Duration must be positive, got {duration}"
-        kwargs["t"] = duration
-    if start > 0:
-        kwargs["ss"] = start
-    input_stream = ffmpeg.input(str(input_file), **kwargs).audio
-
-    def make_output_stream(stream: ffmpeg.Stream, output_file: Optional[PathLike]) -> ffmpeg.Stream:
-        if audio_format == "wav":
-            kwargs = {"format": "wav", "ar": "16000", "ac": "1", "map_metadata": "-1"}
-        elif audio_format == "mp3":
-            kwargs = {"format": "mp3", "acodec": "libmp3lame", "ab": "128k", "map_metadata": "-1"}
-        else:
-            raise ValueError(f"Unknown audio format: {audio_format}")
-        if output_file is not None:
-            return stream.output(str(output_file), **kwargs)
-        else:
-            return stream.output('pipe:', **kwargs)
-
-    stream_options = [
-        make_output_stream(input_stream, output_file),
-        make_output_stream(input_stream.filter("aresample", min_hard_comp="0.100000", first_pts="0", **{"async": "1"}), output_file),
-    ]
+    stream_options = _make_trim_streams(input_file, start, end, audio_format, output_file, stream_copy)
 
     at_least_some_data = b""
     for stream in stream_options:
@@ -85,12 +75,210 @@ def trim_audio_and_convert(
             raise RuntimeError(f"All ffmpeg trim attempts failed, got empty output from ffmpeg")
 
 
+async def atrim_audio_and_convert(
+    input_file: PathLike,
+    start: float = 0.0,
+    end: Optional[float] = None,
+    audio_format: Literal["wav", "mp3", "ogg"] = "wav",
+    output_file: Optional[PathLike] = None,
+    stream_copy: bool = False,
+) -> bytes:
+    """Asynchronous version of `trim_audio_and_convert`.
+
+    ffmpeg is run as an asyncio subprocess, so no executor thread is blocked
+    while the segment is being converted. The subprocess is killed if the
+    coroutine is cancelled.
+
+    Fallback commands are only started after the previous one fails, so
+    a chunk that trims normally runs a single ffmpeg process.
+    """
+    stream_options = _make_trim_streams(input_file, start, end, audio_format, output_file, stream_copy)
+
+    at_least_some_data = b""
+    for stream in stream_options:
+        cmd = stream.compile()
+        out, err, returncode = await _run_ffmpeg_async(cmd)
+        if returncode == 0:
+            if b"nothing was encoded" in err:
+                raise AudioTrimError(f"ffmpeg reported that nothing was encoded for trim from {start} to {end}")
+            return out
+        logger.warning(
+            f"ffmpeg trim error for command: {' '.join(cmd)}, "
+            f"got {len(out)} bytes, ffmpeg stderr:\n{err.decode(errors='replace')}"
+        )
+        if len(out) > len(at_least_some_data):
+            at_least_some_data = out
+    if len(at_least_some_data) > 0:
+        logger.warning(f"All ffmpeg trim attempts failed, returning partial data, {len(at_least_some_data)} bytes")
+        return at_least_some_data
+    else:
+        raise RuntimeError(f"All ffmpeg trim attempts failed, got empty output from ffmpeg")
+
+
+def _make_trim_streams(
+    input_file: PathLike,
+    start: float,
+    end: Optional[float],
+    audio_format: Literal["wav", "mp3", "ogg"],
+    output_file: Optional[PathLike],
+    stream_copy: bool = False,
+) -> List[ffmpeg.Stream]:
+    """Build ffmpeg commands for trimming, in order of preference."""
+    assert start >= 0, f"Start time must be non-negative, got {start}"
+    kwargs = {}
+    if end is not None:
+        duration = end - start
+        assert duration > 0, f"Duration must be positive, got {duration}"
+        kwargs["t"] = duration
+    if start > 0:
+        kwargs["ss"] = start
+    input_stream = ffmpeg.input(str(input_file), **kwargs).audio
+
+    def make_output_stream(
+        stream: ffmpeg.Stream,
+        output_file: Optional[PathLike],
+        copy: bool = False,
+    ) -> ffmpeg.Stream:
+        if copy:
+            kwargs = {"format": audio_format, "acodec": "copy", "map_metadata": "-1"}
+        elif audio_format == "wav":
+            kwargs = {"format": "wav", "acodec": "pcm_s16le", "ar": "16000", "ac": "1", "map_metadata": "-1"}
+        elif audio_format == "mp3":
+            kwargs = {"format": "mp3", "acodec": "libmp3lame", "ab": "64k", "ar": "16000", "ac": "1", "map_metadata": "-1"}
+        elif audio_format == "ogg":
+            kwargs = {"format": "ogg", "acodec": "libopus", "ab": "24k", "ar": "16000", "ac": "1", "map_metadata": "-1"}
+        else:
+            raise ValueError(f"Unknown audio format: {audio_format}")
+        if output_file is not None:
+            return stream.output(str(output_file), **kwargs)
+        else:
+            return stream.output('pipe:', **kwargs)
+
+    stream_options = [
+        make_output_stream(input_stream, output_file),
+        make_output_stream(input_stream.filter("aresample", min_hard_comp="0.100000", first_pts="0", **{"async": "1"}), output_file),
+    ]
+    if stream_copy:
+        # fall back to re-encoding if the stream cannot be copied as is
+        stream_options.insert(0, make_output_stream(input_stream, output_file, copy=True))
+    return stream_options
+
+
+async def _run_ffmpeg_async(cmd: List[str]) -> Tuple[bytes, bytes, int]:
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        out, err = await proc.communicate()
+    except BaseException:
+        if proc.returncode is None:
+            proc.kill()
+        raise
+    return out, err, proc.returncode
+
+
+# durations of recently used files, keyed by (path, mtime, size) so that
+# a modified file is probed again; the sync functions may run in executor threads
+_DURATION_CACHE_SIZE = 256
+_duration_cache: "OrderedDict[Tuple[str, int, int], float]" = OrderedDict()
+_duration_cache_lock = threading.Lock()
+
+
+def _get_duration_cache_key(file_path: PathLike) -> Optional[Tuple[str, int, int]]:
+    try:
+        stat = os.stat(file_path)
+    except (OSError, ValueError):
+        return None
+    return str(file_path), stat.st_mtime_ns, stat.st_size
+
+
+def _get_cached_duration(key: Optional[Tuple[str, int, int]]) -> Optional[float]:
+    if key is None:
+        return None
+    with _duration_cache_lock:
+        duration = _duration_cache.get(key)
+        if duration is not None:
+            _duration_cache.move_to_end(key)
+        return duration
+
+
+def _cache_duration(key: Optional[Tuple[str, int, int]], duration: float) -> float:
+    if key is not None:
+        with _duration_cache_lock:
+            _duration_cache[key] = duration
+            _duration_cache.move_to_end(key)
+            if len(_duration_cache) > _DURATION_CACHE_SIZE:
+                _duration_cache.popitem(last=False)  # least recently used
+    return duration
+
+
 def get_audio_duration(file_path: PathLike) -> float:
+    key = _get_duration_cache_key(file_path)
+    duration = _get_cached_duration(key)
+    if duration is not None:
+        return duration
+    duration = get_audio_duration_mutagen(file_path)
+    if duration is not None:
+        return _cache_duration(key, duration)
     try:
-        return get_audio_duration_ffprobe(file_path)
+        duration = get_audio_duration_ffprobe(file_path)
     except Exception as e:
         logger.warning(f"Error getting audio duration using ffprobe: {e}")
-        return get_audio_duration_decode(file_path)
+        duration = get_audio_duration_decode(file_path)
+    return _cache_duration(key, duration)
+
+
+async def aget_audio_duration(file_path: PathLike, executor: Optional[Executor] = None) -> float:
+    """Asynchronous version of `get_audio_duration`.
+
+    ffprobe is run as an asyncio subprocess, reading metadata with mutagen
+    and the decoding fallback are run in `executor` (the default executor
+    of the event loop if None).
+    """
+    key = _get_duration_cache_key(file_path)
+    duration = _get_cached_duration(key)
+    if duration is not None:
+        return duration
+    loop = asyncio.get_running_loop()
+    if mutagen is not None:
+        duration = await loop.run_in_executor(executor, get_audio_duration_mutagen, file_path)
+        if duration is not None:
+            return _cache_duration(key, duration)
+    try:
+        duration = await aget_audio_duration_ffprobe(file_path)
+    except Exception as e:
+        logger.warning(f"Error getting audio duration using ffprobe: {e}")
+        duration = await loop.run_in_executor(executor, get_audio_duration_decode, file_path)
+    return _cache_duration(key, duration)
+
+
+def get_audio_duration_mutagen(file_path: PathLike) -> Optional[float]:
+    """Read duration from container metadata if mutagen is installed,
+    without starting a subprocess. Return None if it is not available or
+    is only an estimate: mutagen computes the length of MP3 files without
+    a Xing/Info or VBRI header from the file size, which is wrong for VBR.
+    """
+    if mutagen is None:
+        return None
+    try:
+        audio = mutagen.File(str(file_path))
+    except Exception as e:
+        logger.debug(f"Error getting audio duration using mutagen: {e}")
+        return None
+    if audio is None or audio.info is None or getattr(audio.info, "sketchy", False):
+        return None
+    if (
+        isinstance(audio.info, mutagen.mp3.MPEGInfo)
+        and audio.info.bitrate_mode == mutagen.mp3.BitrateMode.UNKNOWN
+    ):
+        return None  # no Xing/Info or VBRI header, length is estimated from file size
+    duration = getattr(audio.info, "length", None)
+    if not duration or duration <= 0:
+        return None
+    return float(duration)
 
 
 def get_audio_duration_ffprobe(file_path: PathLike) -> float:
@@ -98,8 +286,25 @@ def get_audio_duration_ffprobe(file_path: PathLike) -> float:
         metadata = ffmpeg.probe(str(file_path))
     except ffmpeg.Error as e:
         raise RuntimeError(f"Could not get duration using ffprobe, ffmpeg stderr:\n{e.stderr.decode()}")
+    return _get_duration_from_probe(metadata)
+
+
+async def aget_audio_duration_ffprobe(file_path: PathLike) -> float:
+    # only container and stream durations are needed, skip the rest of the probe
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-show_entries", "stream=codec_type,duration:format=duration",
+        "-of", "json",
+        str(file_path),
+    ]
+    out, err, returncode = await _run_ffmpeg_async(cmd)
+    if returncode != 0:
+        raise RuntimeError(f"Could not get duration using ffprobe, ffmpeg stderr:\n{err.decode(errors='replace')}")
+    return _get_duration_from_probe(json.loads(out))
+
 
-    audio_streams = [s for s in metadata["streams"] if s["codec_type"] == "audio"]
+def _get_duration_from_probe(metadata: dict) -> float:
+    audio_streams = [s for s in metadata.get("streams", []) if s.get("codec_type") == "audio"]
     if len(audio_streams) == 0:
         raise NoAudioStreamsError("No audio streams found")
 